@@ -9,20 +9,32 @@ import os
 import time
 import uuid
 import json
+import queue
 import threading
 import logging
-import signal
-import subprocess
+import shutil
+import tempfile
+import mimetypes
+import sqlite3
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 from pathlib import Path
-from functools import wraps
+from functools import wraps, lru_cache
+from urllib.parse import quote, unquote
 
-from flask import Flask, request, jsonify, send_from_directory, render_template, url_for
+import orjson
+import psutil
+from flask import Flask, Response, request, jsonify, send_from_directory, render_template, url_for
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
 # Import the video compressor functions
-from video_compressor import compress_video, get_video_info, check_ffmpeg
+from video_compressor import (
+    compress_video, get_video_info, check_ffmpeg, get_available_encoders, check_encoder,
+    hwaccel_input_args, video_filter_args, video_codec_args, video_bitrate_args,
+    is_hardware_encoder, parse_bitrate, target_video_bitrate, run_ffmpeg as run_ffmpeg_process
+)
 
 # Configure logging
 logging.basicConfig(
@@ -31,8 +43,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider that uses orjson, which is much faster than the stdlib encoder."""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable Cross-Origin Resource Sharing
 
 # Configuration
@@ -40,14 +62,66 @@ app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__fil
 app.config['OUTPUT_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compressed')
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024 * 1024  # 5GB max upload size
 app.config['ALLOWED_EXTENSIONS'] = {'mp4', 'mov', 'avi', 'mkv', 'wmv', 'flv'}
+app.config['X_ACCEL_REDIRECT_PREFIX'] = '/_protected/'  # nginx internal location for OUTPUT_FOLDER
+app.config['JOBS_DATABASE'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.db')
+app.config['JOB_TTL'] = 3600  # Seconds to keep finished jobs
+app.config['MAX_CONCURRENT_JOBS'] = max(1, (os.cpu_count() or 2) // 2)  # ffmpeg processes at once
+
+# Seconds a cancelled FFmpeg process gets to exit before it is killed
+CANCEL_TIMEOUT = 3
+
+# Minimum progress change (percent) and interval (seconds) between job updates
+PROGRESS_MIN_STEP = 1
+PROGRESS_MIN_INTERVAL = 0.5
+
+# Chunk size for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Headers carrying compression options for streamed uploads
+COMPRESSION_OPTION_HEADERS = {
+    'target_size_mb': 'X-Target-Size-MB',
+    'codec': 'X-Codec',
+    'crf': 'X-CRF',
+    'preset': 'X-Preset',
+    'max_width': 'X-Max-Width',
+    'audio_bitrate': 'X-Audio-Bitrate',
+    'rate_control': 'X-Rate-Control',
+}
+
+# Hardware encoders to offer when FFmpeg has them and the hardware is present
+HW_ENCODER_CANDIDATES = ('hevc_nvenc', 'h264_nvenc', 'hevc_qsv', 'hevc_vaapi')
+
+# Probe once at startup; libx265 and friends remain available as fallbacks
+_available_encoders = get_available_encoders()
+HW_ENCODERS = frozenset(
+    codec for codec in HW_ENCODER_CANDIDATES
+    if codec in _available_encoders and check_encoder(codec)
+)
+app.config['ALLOWED_CODECS'] = {'libx264', 'libx265', 'vp9'} | HW_ENCODERS
 
 # Create upload and output directories if they don't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
-# Store active compression jobs
-active_jobs = {}
-job_lock = threading.Lock()
+# Job state lives in SQLite so it survives restarts; each thread gets its own connection
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+_db_local = threading.local()
+
+# Compression jobs wait here for one of MAX_CONCURRENT_JOBS worker threads
+job_queue = queue.Queue()
+
+def job_worker():
+    """Run queued compression jobs one at a time."""
+    while True:
+        args = job_queue.get()
+        try:
+            process_video_async(*args)
+        except Exception:
+            logger.exception("Unexpected error in compression worker")
+
+# Daemon workers, so queued jobs die with the server like running ones
+for worker_number in range(app.config['MAX_CONCURRENT_JOBS']):
+    threading.Thread(target=job_worker, name=f'compress_{worker_number}', daemon=True).start()
 
 # Store active processes for cancellation
 active_processes = {}
@@ -57,31 +131,115 @@ def allowed_file(filename):
     """Check if the file extension is allowed."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def get_db():
+    """Get this thread's connection to the jobs database."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        # Autocommit mode; read-modify-write updates open their own transactions
+        conn = sqlite3.connect(app.config['JOBS_DATABASE'], isolation_level=None, timeout=30)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _db_local.conn = conn
+    return conn
+
+@contextmanager
+def db_transaction():
+    """Run a block in a write transaction, so concurrent updates don't interleave."""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+def init_db():
+    """Create the jobs table and fail jobs interrupted by a restart."""
+    conn = get_db()
+    # WAL lets status reads proceed while a job is being updated
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id TEXT PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL, data BLOB NOT NULL)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at)')
+    
+    # Their FFmpeg processes died with the previous server
+    interrupted = conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'processing')").fetchall()
+    for (job_id,) in interrupted:
+        update_job_status(job_id, 'failed', message='Job interrupted by a server restart')
+
+def job_from_row(status, updated_at, data):
+    """Build a job dict from a jobs table row."""
+    return {
+        **orjson.loads(data),
+        'status': status,
+        'updated_at': updated_at
+    }
+
 def get_job_status(job_id):
     """Get the status of a compression job."""
-    with job_lock:
-        return active_jobs.get(job_id, {})
+    row = get_db().execute(
+        'SELECT status, updated_at, data FROM jobs WHERE id = ?', (job_id,)
+    ).fetchone()
+    return job_from_row(*row) if row else {}
 
 def update_job_status(job_id, status, **kwargs):
-    """Update the status of a compression job."""
-    with job_lock:
-        if job_id not in active_jobs:
-            active_jobs[job_id] = {}
-        
-        active_jobs[job_id].update({
-            'status': status,
-            'updated_at': time.time(),
-            **kwargs
-        })
+    """Update the status of a compression job, merging in any extra fields."""
+    with db_transaction() as conn:
+        row = conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        data = orjson.loads(row[0]) if row else {}
+        data.update(kwargs)
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (id, status, updated_at, data) VALUES (?, ?, ?, ?)',
+            (job_id, status, time.time(), orjson.dumps(data))
+        )
 
 def clean_old_jobs():
-    """Remove completed jobs older than 1 hour."""
-    current_time = time.time()
-    with job_lock:
-        for job_id in list(active_jobs.keys()):
-            job = active_jobs[job_id]
-            if job.get('status') in ['completed', 'failed', 'cancelled'] and current_time - job.get('updated_at', 0) > 3600:
-                del active_jobs[job_id]
+    """Remove finished jobs older than JOB_TTL."""
+    cutoff = time.time() - app.config['JOB_TTL']
+    get_db().execute(
+        f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))}) AND updated_at < ?",
+        (*FINISHED_STATUSES, cutoff)
+    )
+
+def update_job_progress(job_id, progress):
+    """Update the progress of a running job without reviving a cancelled one."""
+    with db_transaction() as conn:
+        row = conn.execute(
+            "SELECT data FROM jobs WHERE id = ? AND status = 'processing'", (job_id,)
+        ).fetchone()
+        if row:
+            data = orjson.loads(row[0])
+            data['progress'] = progress
+            conn.execute(
+                'UPDATE jobs SET updated_at = ?, data = ? WHERE id = ?',
+                (time.time(), orjson.dumps(data), job_id)
+            )
+
+def update_active_job(job_id, **kwargs):
+    """
+    Mark a queued or running job as processing, merging in any extra fields.
+    
+    Returns False without touching the job if it has finished or was
+    cancelled in the meantime.
+    """
+    with db_transaction() as conn:
+        row = conn.execute(
+            "SELECT data FROM jobs WHERE id = ? AND status IN ('queued', 'processing')", (job_id,)
+        ).fetchone()
+        if not row:
+            return False
+        data = orjson.loads(row[0])
+        data.update(kwargs)
+        conn.execute(
+            "UPDATE jobs SET status = 'processing', updated_at = ?, data = ? WHERE id = ?",
+            (time.time(), orjson.dumps(data), job_id)
+        )
+        return True
+
+# Set up the jobs database on startup
+init_db()
 
 def register_process(job_id, process):
     """Register a process for potential cancellation."""
@@ -95,88 +253,157 @@ def unregister_process(job_id):
             del active_processes[job_id]
 
 def cancel_process(job_id):
-    """Cancel a running process."""
+    """Cancel a running process along with any processes it spawned."""
     with process_lock:
         process = active_processes.get(job_id)
-        if process:
+    
+    if not process:
+        return False
+    
+    try:
+        parent = psutil.Process(process.pid)
+        procs = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        # Already finished
+        return False
+    
+    try:
+        for proc in procs:
             try:
-                # On Windows, we need to use taskkill to kill the process tree
-                if os.name == 'nt':
-                    subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], 
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                else:
-                    # On Unix-like systems, we can use process group
-                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                return True
-            except Exception as e:
-                logger.error(f"Error cancelling process: {e}")
-                return False
+                proc.terminate()
+            except psutil.NoSuchProcess:
+                pass
+        
+        # Give the tree a moment to exit cleanly before forcing it
+        _, alive = psutil.wait_procs(procs, timeout=CANCEL_TIMEOUT)
+        for proc in alive:
+            try:
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+        return True
+    except Exception as e:
+        logger.error(f"Error cancelling process: {e}")
         return False
 
+@lru_cache(maxsize=256)
+def crf_encoder_args(codec, crf, preset, audio_bitrate):
+    """
+    Get the video and audio encoder options for a CRF job.
+    
+    Options only vary with a handful of codecs, CRFs, presets and bitrates,
+    so the tuples are built once and shared between jobs.
+    """
+    return tuple(video_codec_args(codec, crf, preset)) + ("-c:a", "aac", "-b:a", audio_bitrate)
+
+def run_ffmpeg(job_id, cmd, duration, progress_start, progress_span, cwd=None):
+    """
+    Run an FFmpeg command for a job, reporting its progress.
+    
+    The job's progress moves from progress_start to progress_start +
+    progress_span as the encode advances through the given duration
+    (in seconds).
+    
+    Returns:
+        Tuple of (returncode, stderr tail)
+    """
+    last_pushed_progress = -1
+    last_pushed_at = 0
+    
+    def report_progress(status):
+        nonlocal last_pushed_progress, last_pushed_at
+        if duration <= 0:
+            return
+        progress = progress_start + int(progress_span * max(0.0, min(status.out_time / duration, 1)))
+        
+        # Coalesce updates: skip unless progress moved a full step or time has passed
+        now = time.monotonic()
+        if (progress - last_pushed_progress < PROGRESS_MIN_STEP
+                and now - last_pushed_at < PROGRESS_MIN_INTERVAL):
+            return
+        
+        update_job_progress(job_id, progress)
+        last_pushed_progress = progress
+        last_pushed_at = now
+    
+    try:
+        # Register the process for potential cancellation
+        return run_ffmpeg_process(
+            cmd,
+            duration,
+            report_progress,
+            cwd=cwd,
+            on_start=lambda process: register_process(job_id, process)
+        )
+    finally:
+        # Unregister the process
+        unregister_process(job_id)
+
 def process_video_async(job_id, input_path, output_path, compression_options):
     """Process a video asynchronously."""
     try:
-        update_job_status(job_id, 'processing', progress=0)
+        # Skip jobs that were cancelled while waiting in the queue
+        if not update_active_job(job_id, progress=0):
+            return
         
         # Get original video info
         original_info = get_video_info(input_path)
         original_size = original_info.get('size_mb', 0)
         
-        update_job_status(
-            job_id, 
-            'processing', 
-            progress=10, 
-            original_info=original_info
-        )
+        # Stop if the job was cancelled while probing
+        if not update_active_job(job_id, progress=10, original_info=original_info):
+            return
         
-        # Prepare FFmpeg command
-        cmd = ["ffmpeg", "-i", input_path]
+        codec = compression_options.get('codec', 'libx265')
+        preset = compression_options.get('preset', 'medium')
+        audio_bitrate = compression_options.get('audio_bitrate', '128k')
+        duration = original_info.get('duration', 0)
         
-        # Add scaling if max_width is specified
-        max_width = compression_options.get('max_width')
-        if max_width:
-            cmd.extend(["-vf", f"scale='min({max_width},iw)':-2"])
+        # Prepare FFmpeg command; run_ffmpeg adds the progress output
+        input_args = [
+            "ffmpeg", "-hide_banner",
+            "-loglevel", "error"
+        ]
+        input_args.extend(hwaccel_input_args(codec))
+        input_args.extend(["-i", input_path])
         
-        # Add video codec settings
-        cmd.extend([
-            "-c:v", compression_options.get('codec', 'libx265'),
-            "-crf", str(compression_options.get('crf', 28)),
-            "-preset", compression_options.get('preset', 'medium')
-        ])
+        # Add scaling if max_width is specified
+        input_args.extend(video_filter_args(codec, compression_options.get('max_width')))
         
         # Add audio settings
-        cmd.extend([
+        output_args = [
             "-c:a", "aac",
-            "-b:a", compression_options.get('audio_bitrate', '128k')
-        ])
+            "-b:a", audio_bitrate,
+            "-y", output_path
+        ]
         
-        # Add additional optimization flags based on codec
-        if compression_options.get('codec') == 'libx265':
-            cmd.extend(["-x265-params", "log-level=error"])
-        
-        # Output file
-        cmd.extend(["-y", output_path])
-        
-        # Run FFmpeg with process tracking for cancellation
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-            # Create a new process group on Unix-like systems
-            preexec_fn=os.setpgrp if os.name != 'nt' else None
-        )
-        
-        # Register the process for potential cancellation
-        register_process(job_id, process)
+        use_target_size = compression_options.get('rate_control') == 'target_size'
+        if use_target_size and duration <= 0:
+            logger.warning(f"Unknown duration for job {job_id}, falling back to CRF encoding")
+            use_target_size = False
         
-        # Wait for the process to complete
-        stdout, stderr = process.communicate()
+        if not use_target_size:
+            cmd = input_args + list(crf_encoder_args(codec, compression_options.get('crf', 28), preset, audio_bitrate))
+            cmd.extend(["-y", output_path])
+            returncode, stderr = run_ffmpeg(job_id, cmd, duration, 10, 88)
         
-        # Unregister the process
-        unregister_process(job_id)
+        else:
+            bitrate = target_video_bitrate(compression_options.get('target_size_mb', 30), duration, audio_bitrate)
+            
+            if is_hardware_encoder(codec):
+                # Hardware encoders hit the bitrate in a single pass
+                cmd = input_args + video_bitrate_args(codec, bitrate, preset) + output_args
+                returncode, stderr = run_ffmpeg(job_id, cmd, duration, 10, 88)
+            
+            else:
+                # Two-pass encode; pass logs live in a per-job directory used as the working directory
+                with tempfile.TemporaryDirectory(prefix=f"{job_id}_") as pass_dir:
+                    cmd = input_args + video_bitrate_args(codec, bitrate, preset, pass_number=1) + ["-an", "-f", "null", "-"]
+                    returncode, stderr = run_ffmpeg(job_id, cmd, duration, 10, 44, cwd=pass_dir)
+                    
+                    if returncode == 0 and get_job_status(job_id).get('status') != 'cancelled':
+                        cmd = input_args + video_bitrate_args(codec, bitrate, preset, pass_number=2) + output_args
+                        returncode, stderr = run_ffmpeg(job_id, cmd, duration, 54, 44, cwd=pass_dir)
         
         # Check if the job was cancelled
         job_status = get_job_status(job_id)
@@ -189,7 +416,7 @@ def process_video_async(job_id, input_path, output_path, compression_options):
                     pass
             return
         
-        if process.returncode != 0:
+        if returncode != 0:
             update_job_status(job_id, 'failed', message=f"FFmpeg error: {stderr}")
             return
         
@@ -218,6 +445,77 @@ def process_video_async(job_id, input_path, output_path, compression_options):
         # Unregister the process if an exception occurred
         unregister_process(job_id)
 
+def parse_compression_options(values):
+    """
+    Build compression options from form fields or an equivalent mapping.
+    
+    Raises ValueError if an option is malformed or the codec is not supported.
+    """
+    compression_options = {
+        'target_size_mb': int(values.get('target_size_mb', 30)),
+        'codec': values.get('codec', 'libx265'),
+        'crf': int(values.get('crf', 28)),
+        'preset': values.get('preset', 'medium'),
+        'audio_bitrate': values.get('audio_bitrate', '128k'),
+        'rate_control': values.get('rate_control', 'crf'),
+    }
+    
+    # Add max_width if provided
+    max_width = values.get('max_width')
+    if max_width and max_width.isdigit():
+        compression_options['max_width'] = int(max_width)
+    
+    if compression_options['rate_control'] not in ('crf', 'target_size'):
+        raise ValueError("Rate control must be 'crf' or 'target_size'")
+    
+    if compression_options['target_size_mb'] <= 0:
+        raise ValueError("Target size must be a positive number of megabytes")
+    
+    try:
+        audio_bitrate_valid = parse_bitrate(compression_options['audio_bitrate']) > 0
+    except ValueError:
+        audio_bitrate_valid = False
+    if not audio_bitrate_valid:
+        raise ValueError("Audio bitrate must be a bitrate such as '128k'")
+    
+    if compression_options['codec'] not in app.config['ALLOWED_CODECS']:
+        raise ValueError(
+            f'Codec not supported. Supported codecs: {", ".join(sorted(app.config["ALLOWED_CODECS"]))}'
+        )
+    
+    return compression_options
+
+def queue_compression_job(job_id, filename, input_path, compression_options):
+    """Register an uploaded video as a job and queue it for compression."""
+    # Expire finished jobs before adding a new one
+    clean_old_jobs()
+    
+    base_name, extension = os.path.splitext(filename)
+    
+    # Prepare output path
+    output_filename = f"compressed_{base_name}{extension}"
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{job_id}_{output_filename}")
+    
+    # Initialize job status
+    update_job_status(
+        job_id, 
+        'queued',
+        filename=filename,
+        input_path=input_path,
+        output_path=output_path,
+        compression_options=compression_options
+    )
+    
+    # Queue compression for the worker threads
+    job_queue.put((job_id, input_path, output_path, compression_options))
+    
+    # Return job ID
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'message': 'Video compression started'
+    })
+
 @app.route('/')
 def index():
     """Render the web interface."""
@@ -256,55 +554,108 @@ def compress_video_api():
             'message': f'File type not allowed. Allowed types: {", ".join(app.config["ALLOWED_EXTENSIONS"])}'
         }), 400
     
+    # Get compression options from the request
+    try:
+        compression_options = parse_compression_options(request.form)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
     # Generate a unique job ID and secure filename
     job_id = str(uuid.uuid4())
     filename = secure_filename(file.filename)
-    base_name, extension = os.path.splitext(filename)
     
-    # Save the uploaded file
+    # Save the uploaded file in large chunks rather than FileStorage.save's 16 KB default
     input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
-    file.save(input_path)
+    with open(input_path, 'wb') as out:
+        shutil.copyfileobj(file.stream, out, length=UPLOAD_CHUNK_SIZE)
     
-    # Prepare output path
-    output_filename = f"compressed_{base_name}{extension}"
-    output_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{job_id}_{output_filename}")
+    return queue_compression_job(job_id, filename, input_path, compression_options)
+
+@app.route('/api/compress_stream', methods=['POST'])
+def compress_video_stream_api():
+    """
+    API endpoint to compress a video sent as the raw request body.
     
-    # Get compression options from the request
-    compression_options = {
-        'target_size_mb': int(request.form.get('target_size_mb', 30)),
-        'codec': request.form.get('codec', 'libx265'),
-        'crf': int(request.form.get('crf', 28)),
-        'preset': request.form.get('preset', 'medium'),
-        'audio_bitrate': request.form.get('audio_bitrate', '128k'),
+    The body is written straight to disk in fixed-size chunks, skipping
+    multipart parsing. The filename and compression options are passed in
+    headers: X-Filename (URL-encoded), X-Target-Size-MB, X-Codec, X-CRF,
+    X-Preset, X-Max-Width, X-Audio-Bitrate and X-Rate-Control.
+    """
+    # Check if FFmpeg is installed
+    if not check_ffmpeg():
+        return jsonify({
+            'success': False,
+            'message': 'FFmpeg is not installed or not in PATH'
+        }), 500
+    
+    original_filename = unquote(request.headers.get('X-Filename', ''))
+    
+    # Check if a filename was provided
+    if not original_filename:
+        return jsonify({
+            'success': False,
+            'message': 'No filename provided in the X-Filename header'
+        }), 400
+    
+    # Check if the file extension is allowed
+    if not allowed_file(original_filename):
+        return jsonify({
+            'success': False,
+            'message': f'File type not allowed. Allowed types: {", ".join(app.config["ALLOWED_EXTENSIONS"])}'
+        }), 400
+    
+    # Map option headers onto the same names used by the form fields
+    header_values = {
+        name: request.headers[header]
+        for name, header in COMPRESSION_OPTION_HEADERS.items()
+        if header in request.headers
     }
+    try:
+        compression_options = parse_compression_options(header_values)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
-    # Add max_width if provided
-    max_width = request.form.get('max_width')
-    if max_width and max_width.isdigit():
-        compression_options['max_width'] = int(max_width)
+    # Generate a unique job ID and secure filename
+    job_id = str(uuid.uuid4())
+    filename = secure_filename(original_filename)
     
-    # Initialize job status
-    update_job_status(
-        job_id, 
-        'queued',
-        filename=filename,
-        input_path=input_path,
-        output_path=output_path,
-        compression_options=compression_options
-    )
+    # Stream the request body to disk; MAX_CONTENT_LENGTH still caps the size
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
+    try:
+        with open(input_path, 'wb', buffering=UPLOAD_CHUNK_SIZE) as f:
+            while True:
+                chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+    except Exception:
+        # Don't leave partial uploads behind
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        raise
     
-    # Start compression in a background thread
-    threading.Thread(
-        target=process_video_async,
-        args=(job_id, input_path, output_path, compression_options),
-        daemon=True
-    ).start()
+    if os.path.getsize(input_path) == 0:
+        os.remove(input_path)
+        return jsonify({
+            'success': False,
+            'message': 'Empty request body'
+        }), 400
     
-    # Return job ID
+    return queue_compression_job(job_id, filename, input_path, compression_options)
+
+@app.route('/api/codecs', methods=['GET'])
+def list_codecs():
+    """API endpoint to list the codecs this server accepts."""
     return jsonify({
         'success': True,
-        'job_id': job_id,
-        'message': 'Video compression started'
+        'codecs': sorted(app.config['ALLOWED_CODECS']),
+        'hardware': sorted(HW_ENCODERS)
     })
 
 @app.route('/api/status/<job_id>', methods=['GET'])
@@ -318,10 +669,19 @@ def get_job_status_api(job_id):
             'message': 'Job not found'
         }), 404
     
-    return jsonify({
-        'success': True,
-        'job': job
-    })
+    # Every change to a job bumps updated_at, so it doubles as the ETag
+    etag = repr(job.get('updated_at'))
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({
+            'success': True,
+            'job': job
+        })
+    
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/cancel/<job_id>', methods=['POST'])
 def cancel_job(job_id):
@@ -340,12 +700,13 @@ def cancel_job(job_id):
             'message': f'Cannot cancel job with status: {job.get("status")}'
         }), 400
     
+    # Mark the job cancelled first, so the worker sees it when FFmpeg exits
+    # and removes the partial output instead of reporting a failure
+    update_job_status(job_id, 'cancelled', message='Job cancelled by user')
+    
     # Cancel the process
     cancelled = cancel_process(job_id)
     
-    # Update job status
-    update_job_status(job_id, 'cancelled', message='Job cancelled by user')
-    
     return jsonify({
         'success': True,
         'message': 'Job cancelled successfully'
@@ -372,12 +733,20 @@ def download_file(job_id):
     
     directory = os.path.dirname(output_path)
     filename = os.path.basename(output_path)
+    download_name = job.get('output_filename', filename)
+    
+    # Behind nginx, hand the transfer to it so the file is sent straight from disk
+    if request.headers.get('X-Accel-Supported'):
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_REDIRECT_PREFIX'] + quote(filename)
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
     
     return send_from_directory(
         directory,
         filename,
         as_attachment=True,
-        download_name=job.get('output_filename', filename)
+        download_name=download_name
     )
 
 @app.route('/api/jobs', methods=['GET'])
@@ -385,8 +754,8 @@ def list_jobs():
     """API endpoint to list all active jobs."""
     clean_old_jobs()
     
-    with job_lock:
-        jobs = {job_id: job for job_id, job in active_jobs.items()}
+    rows = get_db().execute('SELECT id, status, updated_at, data FROM jobs').fetchall()
+    jobs = {job_id: job_from_row(status, updated_at, data) for job_id, status, updated_at, data in rows}
     
     return jsonify({
         'success': True,
@@ -399,5 +768,5 @@ if __name__ == '__main__':
         logger.error("FFmpeg is not installed or not in PATH. Please install FFmpeg first.")
         exit(1)
     
-    # Start the server
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Start the development server; use wsgi.py with gunicorn in production
+    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
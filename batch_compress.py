@@ -7,12 +7,26 @@ A simple GUI for batch compressing multiple video files.
 
 import os
 import sys
+import json
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import subprocess
 import threading
 import queue
 
+# Shares the folder scan with the command line tool
+from video_compressor import iter_videos
+
+# Log events from video_compressor.py that mean a file is finished
+_FILE_DONE_EVENTS = frozenset({'done', 'skipped', 'failed'})
+
+# Number of paths a folder scan hands to the GUI at a time
+SCAN_BATCH_SIZE = 256
+
+# How often and how much of the worker log the GUI shows per tick
+LOG_DRAIN_INTERVAL_MS = 50
+LOG_DRAIN_MAX_LINES = 500
+
 class BatchCompressorGUI:
     def __init__(self, root):
         self.root = root
@@ -21,13 +35,19 @@ class BatchCompressorGUI:
         self.root.minsize(600, 500)
         
         self.input_files = []
+        self._input_set = set()  # Mirrors input_files for fast duplicate checks
         self.output_dir = ""
         self.process_queue = queue.Queue()
         self.is_processing = False
         
+        # Log lines from the worker thread, shown by _drain_log on the Tk thread
+        self.log_q = queue.Queue(maxsize=1024)
+        
         self.create_widgets()
         self.create_layout()
         
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self._drain_log)
+        
     def create_widgets(self):
         # Input files frame
         self.input_frame = ttk.LabelFrame(self.root, text="Input Videos")
@@ -55,10 +75,13 @@ class BatchCompressorGUI:
         # Compression settings frame
         self.settings_frame = ttk.LabelFrame(self.root, text="Compression Settings")
         
-        # Target size
-        self.size_label = ttk.Label(self.settings_frame, text="Target Size (MB):")
+        # Target size; when unchecked the CRF alone decides the size
+        self.use_size_var = tk.BooleanVar(value=False)
+        self.size_label = ttk.Checkbutton(self.settings_frame, text="Target Size (MB):",
+                                          variable=self.use_size_var, command=self.update_size_state)
         self.size_var = tk.IntVar(value=30)
-        self.size_entry = ttk.Spinbox(self.settings_frame, from_=5, to=100, textvariable=self.size_var, width=5)
+        self.size_entry = ttk.Spinbox(self.settings_frame, from_=5, to=100, textvariable=self.size_var, width=5,
+                                      state=tk.DISABLED)
         
         # Codec
         self.codec_label = ttk.Label(self.settings_frame, text="Codec:")
@@ -114,6 +137,10 @@ class BatchCompressorGUI:
         self.start_button = ttk.Button(self.buttons_frame, text="Start Compression", command=self.start_compression)
         self.stop_button = ttk.Button(self.buttons_frame, text="Stop", command=self.stop_compression, state=tk.DISABLED)
         
+    def update_size_state(self):
+        """Enable the target size only while it is checked."""
+        self.size_entry.configure(state=tk.NORMAL if self.use_size_var.get() else tk.DISABLED)
+    
     def create_layout(self):
         # Input files frame
         self.input_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -178,34 +205,52 @@ class BatchCompressorGUI:
         )
         
         if files:
-            for file in files:
-                if file not in self.input_files:
-                    self.input_files.append(file)
-                    self.files_listbox.insert(tk.END, os.path.basename(file))
+            self._append_paths(files)
     
     def add_folder(self):
         folder = filedialog.askdirectory(title="Select Folder with Videos")
         
         if folder:
-            video_extensions = ('.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv')
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    if file.lower().endswith(video_extensions):
-                        full_path = os.path.join(root, file)
-                        if full_path not in self.input_files:
-                            self.input_files.append(full_path)
-                            self.files_listbox.insert(tk.END, file)
+            # Scan in the background so large folders don't freeze the window
+            threading.Thread(target=self._scan_folder, args=(folder,), daemon=True).start()
+    
+    def _scan_folder(self, folder):
+        """Find videos below a folder and hand them to the Tk thread in batches."""
+        batch = []
+        for full_path in iter_videos(folder):
+            batch.append(full_path)
+            if len(batch) >= SCAN_BATCH_SIZE:
+                self.root.after(0, self._append_paths, batch)
+                batch = []
+        
+        if batch:
+            self.root.after(0, self._append_paths, batch)
+    
+    def _append_paths(self, paths):
+        """Add new input files, skipping ones already in the list."""
+        new_names = []
+        for full_path in paths:
+            if full_path not in self._input_set:
+                self._input_set.add(full_path)
+                self.input_files.append(full_path)
+                new_names.append(os.path.basename(full_path))
+        
+        # Insert everything in one call to avoid a Tcl round-trip per file
+        if new_names:
+            self.files_listbox.insert(tk.END, *new_names)
     
     def remove_files(self):
         selected = self.files_listbox.curselection()
         
         # Remove in reverse order to avoid index shifting
         for index in sorted(selected, reverse=True):
+            self._input_set.discard(self.input_files[index])
             del self.input_files[index]
             self.files_listbox.delete(index)
     
     def clear_files(self):
         self.input_files = []
+        self._input_set.clear()
         self.files_listbox.delete(0, tk.END)
     
     def browse_output(self):
@@ -221,6 +266,20 @@ class BatchCompressorGUI:
         self.log_text.see(tk.END)
         self.log_text.configure(state=tk.DISABLED)
     
+    def _drain_log(self):
+        """Show queued worker log lines with a single Text insert per tick."""
+        lines = []
+        try:
+            while len(lines) < LOG_DRAIN_MAX_LINES:
+                lines.append(self.log_q.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if lines:
+            self.log("\n".join(lines))
+        
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self._drain_log)
+    
     def start_compression(self):
         if not self.input_files:
             messagebox.showerror("Error", "No input files selected.")
@@ -256,7 +315,8 @@ class BatchCompressorGUI:
         cmd_args.extend(["-o", output_dir])
         
         # Add compression settings
-        cmd_args.extend(["-s", str(self.size_var.get())])
+        if self.use_size_var.get():
+            cmd_args.extend(["-s", str(self.size_var.get())])
         cmd_args.extend(["-c", self.codec_var.get()])
         cmd_args.extend(["--crf", str(self.crf_var.get())])
         cmd_args.extend(["-p", self.preset_var.get()])
@@ -268,6 +328,9 @@ class BatchCompressorGUI:
         # Add parallel jobs
         cmd_args.extend(["-j", str(self.jobs_var.get())])
         
+        # Read the log as JSON lines instead of matching its text
+        cmd_args.extend(["--log-format", "json"])
+        
         # Update UI
         self.status_var.set("Compressing...")
         self.start_button.configure(state=tk.DISABLED)
@@ -310,24 +373,25 @@ class BatchCompressorGUI:
                     process.terminate()
                     break
                 
-                self.log(line.strip())
+                # Anything that isn't a log record (e.g. a traceback) is shown as is
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.log_q.put(line.strip())
+                    continue
+                
+                self.log_q.put(record.get('message', ''))
+                event = record.get('event')
                 
                 # Update progress based on output
-                if "Compression complete" in line:
+                if event in _FILE_DONE_EVENTS:
                     processed_files += 1
                     progress = (processed_files / total_files) * 100
                     self.progress_var.set(progress)
                 
                 # Update status if batch processing is complete
-                if "Batch processing complete" in line:
-                    success_count = 0
-                    if "files processed successfully" in line:
-                        parts = line.split()
-                        for part in parts:
-                            if "/" in part:
-                                success_count = int(part.split("/")[0])
-                    
-                    self.status_var.set(f"Completed: {success_count}/{total_files} files")
+                elif event == 'batch_done':
+                    self.status_var.set(f"Completed: {record['succeeded']}/{total_files} files")
             
             if self.is_processing:
                 self.status_var.set("Compression completed")
@@ -336,7 +400,7 @@ class BatchCompressorGUI:
                 self.status_var.set("Compression stopped")
             
         except Exception as e:
-            self.log(f"Error: {str(e)}")
+            self.log_q.put(f"Error: {str(e)}")
             self.status_var.set("Error occurred")
         
         finally:
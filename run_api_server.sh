@@ -10,4 +10,4 @@ echo ""
 echo "Starting API server..."
 echo "Access the web interface at http://localhost:5000"
 echo ""
-python3 api_server.py 
\ No newline at end of file
+gunicorn -k gthread -w 1 --threads 16 --timeout 0 -b 0.0.0.0:5000 wsgi:app 
\ No newline at end of file
@@ -7,61 +7,80 @@ It also displays the FFmpeg version and available codecs.
 """
 
 import subprocess
+import shutil
 import sys
 import os
 import platform
 
+try:
+    # Shares the cached FFmpeg probe with the compressor
+    from video_compressor import probe_ffmpeg
+except ImportError:
+    probe_ffmpeg = None
+
+
+def _probe_uncached():
+    """Get the version line and encoder names without video_compressor.py."""
+    result = subprocess.run(
+        ["ffmpeg", "-version"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    
+    if result.returncode != 0:
+        print(f"Error: {result.stderr}")
+        return None
+    
+    encoders_result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-encoders"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    encoders = {parts[1] for parts in map(str.split, encoders_result.stdout.split('\n')) if len(parts) >= 2}
+    return result.stdout.split('\n')[0], encoders
+
 def check_ffmpeg():
     """Check if FFmpeg is installed and print version information."""
-    try:
-        # Run FFmpeg version command
-        result = subprocess.run(
-            ["ffmpeg", "-version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print("❌ FFmpeg is installed but returned an error.")
-            print(f"Error: {result.stderr}")
-            return False
-        
-        # Extract version information
-        version_info = result.stdout.split('\n')[0]
-        print(f"✅ FFmpeg is installed: {version_info}")
-        
-        # Check for H.264 encoder
-        h264_result = subprocess.run(
-            ["ffmpeg", "-encoders"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        if "libx264" in h264_result.stdout:
-            print("✅ H.264 encoder (libx264) is available")
-        else:
-            print("❌ H.264 encoder (libx264) is NOT available")
-        
-        # Check for H.265 encoder
-        if "libx265" in h264_result.stdout:
-            print("✅ H.265/HEVC encoder (libx265) is available")
-        else:
-            print("❌ H.265/HEVC encoder (libx265) is NOT available")
-        
-        # Check for VP9 encoder
-        if "libvpx-vp9" in h264_result.stdout:
-            print("✅ VP9 encoder (libvpx-vp9) is available")
-        else:
-            print("❌ VP9 encoder (libvpx-vp9) is NOT available")
-        
-        return True
-        
-    except FileNotFoundError:
+    if shutil.which("ffmpeg") is None:
         print("❌ FFmpeg is NOT installed or not in your PATH.")
         print_installation_instructions()
         return False
+    
+    try:
+        probe = probe_ffmpeg() if probe_ffmpeg else _probe_uncached()
+    except OSError as e:
+        print(f"Error: {e}")
+        probe = None
+    
+    if probe is None:
+        print("❌ FFmpeg is installed but returned an error.")
+        return False
+    
+    # Extract version information
+    version_info, encoders = probe
+    print(f"✅ FFmpeg is installed: {version_info}")
+    
+    # Check for H.264 encoder
+    if "libx264" in encoders:
+        print("✅ H.264 encoder (libx264) is available")
+    else:
+        print("❌ H.264 encoder (libx264) is NOT available")
+    
+    # Check for H.265 encoder
+    if "libx265" in encoders:
+        print("✅ H.265/HEVC encoder (libx265) is available")
+    else:
+        print("❌ H.265/HEVC encoder (libx265) is NOT available")
+    
+    # Check for VP9 encoder
+    if "libvpx-vp9" in encoders:
+        print("✅ VP9 encoder (libvpx-vp9) is available")
+    else:
+        print("❌ VP9 encoder (libvpx-vp9) is NOT available")
+    
+    return True
 
 def print_installation_instructions():
     """Print FFmpeg installation instructions based on the operating system."""
@@ -69,8 +88,14 @@ def print_installation_instructions():
     
     print("\nInstallation Instructions:")
     
-    if system == "Windows":
-        print("""
+    print(_INSTALL_HELP.get(
+        system,
+        f"Please visit https://ffmpeg.org/download.html for instructions on how to install FFmpeg on {system}."
+    ))
+
+# Installation instructions by platform.system()
+_INSTALL_HELP = {
+    "Windows": """
 Windows:
 1. Download FFmpeg from https://ffmpeg.org/download.html
    - Choose a Windows build like https://github.com/BtbN/FFmpeg-Builds/releases
@@ -86,17 +111,15 @@ Windows:
 
 Alternatively, you can install FFmpeg using Chocolatey:
    choco install ffmpeg
-""")
-    elif system == "Darwin":  # macOS
-        print("""
+""",
+    "Darwin": """
 macOS:
 1. Install Homebrew if you don't have it already:
    /bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"
 2. Install FFmpeg:
    brew install ffmpeg
-""")
-    elif system == "Linux":
-        print("""
+""",
+    "Linux": """
 Linux (Ubuntu/Debian):
    sudo apt update
    sudo apt install ffmpeg
@@ -104,9 +127,8 @@ Linux (Ubuntu/Debian):
 Linux (CentOS/RHEL):
    sudo yum install epel-release
    sudo yum install ffmpeg
-""")
-    else:
-        print(f"Please visit https://ffmpeg.org/download.html for instructions on how to install FFmpeg on {system}.")
+""",
+}
 
 if __name__ == "__main__":
     print("FFmpeg Installation Test")
@@ -11,19 +11,147 @@ Requirements:
 """
 
 import os
+import re
 import sys
+import json
+import shutil
+import logging
 import argparse
 import subprocess
 import time
+import queue
+import tempfile
+import threading
+from collections import deque
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Tuple, Optional
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Optional, Set, FrozenSet, NamedTuple, Callable
+
+try:
+    # Only needed to pin FFmpeg to CPUs where taskset isn't available
+    import psutil
+except ImportError:
+    psutil = None
+
+log = logging.getLogger("video_compressor")
+
+
+# Default VAAPI render node on Linux
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+# Suffixes of the hardware encoder names
+HW_ENCODER_SUFFIXES = ("_nvenc", "_qsv", "_videotoolbox", "_vaapi", "_amf")
+
+# Hardware encoder families in order of preference for --hwaccel auto
+HWACCEL_FAMILIES = ("nvenc", "qsv", "videotoolbox", "vaapi", "amf")
+
+# Prefix of the hardware encoder names for each software codec
+HW_CODEC_PREFIXES = {'libx265': "hevc", 'libx264': "h264", 'vp9': "vp9"}
+
+# Lowest video bitrate used when a target size leaves little room for video
+MIN_VIDEO_BITRATE = 100_000
+
+# Extra fields of log records that are written to JSON logs
+LOG_FIELDS = ('event', 'file', 'succeeded', 'total')
+
+# Patterns for the stream dump of `ffmpeg -i` (used when ffprobe is missing)
+_STREAM_VIDEO_RE = re.compile(r'Stream[^\n]*?Video: (\w+)(?:[^\n]*?\b(\d{2,4}x\d{2,4})\b)?')
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)')
+
+# Extensions of the files picked up from input directories
+VIDEO_EXTS = frozenset({'.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv'})
+
+# Codecs of inputs that are kept as they are when already under the target size
+COMPRESSED_CODECS = frozenset({'hevc', 'h265', 'vp9'})
+
+# Videos with more pixels than this go to the --jobs-4k queue (half of 4K UHD)
+LARGE_VIDEO_PIXELS = 3840 * 2160 // 2
+
+# Containers that get their index moved to the front for progressive playback
+FASTSTART_EXTENSIONS = frozenset({'.mp4', '.mov', '.m4v'})
+
+# libvpx -cpu-used for each x264-style preset (higher is faster)
+VP9_CPU_USED = {
+    'ultrafast': 5, 'superfast': 5, 'veryfast': 4, 'faster': 4, 'fast': 3,
+    'medium': 2, 'slow': 1, 'slower': 1, 'veryslow': 0,
+}
+
+# Where the FFmpeg version and encoder list are kept between runs
+PROBE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "video_compressor", "probe.json")
+
+# Presets understood by the Intel Quick Sync encoders
+QSV_PRESETS = ("veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+
+
+@lru_cache(maxsize=None)
+def find_executable(name: str) -> str:
+    """
+    Get the full path of a program, searching PATH only once per process.
+    
+    Falls back to the bare name so a missing program still raises
+    FileNotFoundError when it is run.
+    """
+    return shutil.which(name) or name
 
 
 def get_video_info(video_path: str) -> Dict:
-    """Get video information using FFmpeg."""
+    """
+    Get video information using ffprobe.
+    
+    Results are cached by path, modification time and size, so a file is
+    only probed again once it changes.
+    """
+    stat = os.stat(video_path)
+    # Copy so callers can't modify the cached entry
+    return dict(_probe_video_info(os.path.abspath(video_path), stat.st_mtime_ns, stat.st_size))
+
+
+@lru_cache(maxsize=4096)
+def _probe_video_info(video_path: str, mtime_ns: int, size: int) -> Dict:
+    """Probe a video with ffprobe; the stat values only serve as cache key."""
+    cmd = [
+        find_executable("ffprobe"), "-v", "error",
+        "-print_format", "json",
+        "-show_streams", "-show_format",
+        video_path
+    ]
+    
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True)
+    except FileNotFoundError:
+        # Some FFmpeg installs ship without ffprobe
+        video_info = _scrape_video_info(video_path)
+    else:
+        try:
+            data = json.loads(result.stdout or "{}")
+        except ValueError:
+            data = {}
+        
+        video_info = {}
+        for stream in data.get('streams', []):
+            if stream.get('codec_type') == 'video':
+                if stream.get('width') and stream.get('height'):
+                    video_info['resolution'] = f"{stream['width']}x{stream['height']}"
+                if stream.get('codec_name'):
+                    video_info['codec'] = stream['codec_name']
+                break
+        
+        duration = data.get('format', {}).get('duration')
+        if duration:
+            video_info['duration'] = float(duration)
+    
+    # The file size is already known from stat
+    video_info['size_mb'] = size / (1024 * 1024)
+    
+    return video_info
+
+
+def _scrape_video_info(video_path: str) -> Dict:
+    """Get video information from the stream dump of `ffmpeg -i`."""
     cmd = [
-        "ffmpeg", "-i", video_path,
+        find_executable("ffmpeg"), "-i", video_path,
         "-hide_banner"
     ]
     
@@ -34,35 +162,160 @@ def get_video_info(video_path: str) -> Dict:
     # Extract basic information
     video_info = {}
     
-    # Extract resolution
-    resolution_match = None
-    for line in info.split('\n'):
-        if 'Stream' in line and 'Video' in line:
-            import re
-            resolution_match = re.search(r'(\d{2,4}x\d{2,4})', line)
-            if resolution_match:
-                video_info['resolution'] = resolution_match.group(1)
-            
-            # Extract codec
-            codec_match = re.search(r'Video: (\w+)', line)
-            if codec_match:
-                video_info['codec'] = codec_match.group(1)
-                
-    # Get file size
-    video_info['size_mb'] = os.path.getsize(video_path) / (1024 * 1024)
+    # Jump straight to the interesting lines instead of splitting the
+    # whole dump; the compiled patterns take the line bounds directly
+    start = info.find('Duration:')
+    if start >= 0:
+        end = info.find('\n', start)
+        duration_match = _DURATION_RE.match(info, start, end if end >= 0 else len(info))
+        if duration_match:
+            hours, minutes, seconds = duration_match.groups()
+            video_info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    
+    # Codec and resolution of the first video stream, in one pass over the dump
+    stream_match = _STREAM_VIDEO_RE.search(info)
+    if stream_match:
+        video_info['codec'] = stream_match.group(1)
+        if stream_match.group(2):
+            video_info['resolution'] = stream_match.group(2)
     
     return video_info
 
 
+class Progress(NamedTuple):
+    """Encoding progress of a running FFmpeg command."""
+    frame: int
+    fps: float
+    speed: float
+    out_time: float
+    eta: Optional[float]
+
+
+def _drain_stream(stream, lines):
+    """Read a pipe until EOF, keeping only the most recent lines."""
+    for line in iter(stream.readline, ''):
+        lines.append(line)
+
+
+def run_ffmpeg(
+    cmd: List[str],
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+    cwd: Optional[str] = None,
+    cpus: Optional[List[int]] = None,
+    on_start: Optional[Callable[[subprocess.Popen], None]] = None
+) -> Tuple[int, str]:
+    """
+    Run an FFmpeg command, reading its -progress output as it encodes.
+    
+    on_progress is called with a Progress for every progress block; the ETA
+    (in seconds) is only known when the input duration is given. Only the
+    last lines of stderr are kept, so memory stays flat on long encodes.
+    cpus pins FFmpeg and all its threads to those CPUs where the platform
+    allows it. on_start is called with the FFmpeg process once it has
+    started, e.g. to keep it around for cancelling.
+    
+    Returns:
+        Tuple of (returncode, stderr tail)
+    """
+    cmd = cmd[:1] + ["-nostats", "-progress", "pipe:1"] + cmd[1:]
+    
+    # taskset sets the mask before FFmpeg starts any threads
+    taskset = find_executable("taskset") if cpus and sys.platform.startswith("linux") else None
+    if taskset and os.path.isabs(taskset):
+        cmd = [taskset, "-c", ",".join(map(str, cpus))] + cmd
+    else:
+        taskset = None
+    
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        cwd=cwd
+    )
+    
+    if cpus and not taskset:
+        _set_affinity(process.pid, cpus)
+    
+    try:
+        if on_start is not None:
+            on_start(process)
+        
+        stderr_lines = deque(maxlen=64)
+        stderr_thread = threading.Thread(
+            target=_drain_stream,
+            args=(process.stderr, stderr_lines),
+            daemon=True
+        )
+        stderr_thread.start()
+        
+        values = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key != 'progress':
+                values[key] = value
+                continue
+            if on_progress is None:
+                continue
+            
+            try:
+                frame = int(values.get('frame', 0))
+                fps = float(values.get('fps', 0))
+                speed = float(values.get('speed', '0').rstrip('x') or 0)
+                # out_time_ms is reported in microseconds as well; older builds lack out_time_us
+                out_time = int(values.get('out_time_us', values.get('out_time_ms', 0))) / 1_000_000
+                # Early blocks can report a negative time before the first frame
+                out_time = max(out_time, 0.0)
+            except ValueError:
+                # Fields read "N/A" until the first frame is out
+                continue
+            
+            eta = None
+            if duration and speed > 0:
+                eta = max(duration - out_time, 0) / speed
+            on_progress(Progress(frame, fps, speed, out_time, eta))
+        
+        process.wait()
+        stderr_thread.join()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+    
+    return process.returncode, ''.join(stderr_lines)
+
+
+def _set_affinity(pid: int, cpus: List[int]) -> None:
+    """Pin a running process to CPUs with psutil (Windows, Linux without taskset)."""
+    if psutil is None:
+        return
+    try:
+        psutil.Process(pid).cpu_affinity(cpus)
+    except (AttributeError, psutil.Error, OSError, ValueError):
+        # macOS has no CPU affinity; the process may also have exited already
+        pass
+
+
 def compress_video(
     input_path: str, 
     output_path: str, 
-    target_size_mb: int = 30,
+    target_size_mb: Optional[float] = None,
     codec: str = 'libx265',
     crf: int = 28,
     preset: str = 'medium',
     audio_bitrate: str = '128k',
-    max_width: Optional[int] = None
+    max_width: Optional[int] = None,
+    hwaccel: str = 'none',
+    threads: Optional[int] = None,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+    skip_mkdir: bool = False,
+    two_pass: bool = False,
+    cpus: Optional[List[int]] = None
 ) -> Tuple[bool, str, float]:
     """
     Compress a video file using FFmpeg.
@@ -70,12 +323,21 @@ def compress_video(
     Args:
         input_path: Path to the input video file
         output_path: Path to save the compressed video
-        target_size_mb: Target file size in MB
+        target_size_mb: Target file size in MB; encodes at the matching
+            capped bitrate instead of the CRF (default: CRF decides the size)
         codec: Video codec to use (libx264, libx265, etc.)
         crf: Constant Rate Factor (quality - lower is better)
         preset: Encoding preset (slower = better compression)
         audio_bitrate: Audio bitrate
         max_width: Maximum width to scale video to (keeps aspect ratio)
+        hwaccel: Hardware encoder family to use instead of the software
+            codec ('none', 'auto', 'nvenc', 'qsv', ...)
+        threads: Number of threads FFmpeg may use (default: all cores)
+        on_progress: Called with a Progress while the video is encoded
+        skip_mkdir: Don't create the output directory (the caller already did)
+        two_pass: Run two passes (software encoders with a target size,
+            or VP9 in CRF mode)
+        cpus: CPUs to pin FFmpeg to (default: no pinning)
         
     Returns:
         Tuple of (success, message, compression_ratio)
@@ -83,50 +345,91 @@ def compress_video(
     start_time = time.time()
     
     try:
-        # Get original video info
-        original_info = get_video_info(input_path)
-        original_size_mb = original_info.get('size_mb', 0)
+        # Get original size; FFmpeg is only probed when the duration is needed
+        original_size_mb = os.path.getsize(input_path) / (1024 * 1024)
+        # Files already under the target size are left to the CRF, so a
+        # target size never inflates them
+        if target_size_mb and target_size_mb >= original_size_mb:
+            target_size_mb = None
+        duration = None
+        if on_progress or target_size_mb:
+            duration = get_video_info(input_path).get('duration')
         
         # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        if not skip_mkdir:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        
+        # An earlier run may have hard-linked the input here; unlink it so
+        # the encode doesn't overwrite the input through the link
+        if (os.path.exists(output_path) and os.path.samefile(input_path, output_path)
+                and os.path.abspath(input_path) != os.path.abspath(output_path)):
+            os.remove(output_path)
+        
+        # Swap in a hardware encoder if one was requested and works
+        codec = resolve_encoder(codec, hwaccel)
+        
+        # A target size sets a capped bitrate; without one CRF decides the size
+        bitrate = None
+        if target_size_mb and duration:
+            bitrate = target_video_bitrate(target_size_mb, duration, audio_bitrate)
+        
+        # Two passes pay off for any software encoder at a fixed bitrate, but
+        # only VP9 has a two-pass constant-quality mode
+        if bitrate:
+            two_pass = two_pass and not is_hardware_encoder(codec)
+        else:
+            two_pass = two_pass and codec in ('vp9', 'libvpx-vp9')
+        
+        if two_pass:
+            # The pass logs go to a temporary working directory; x265 can't
+            # take a path with a drive letter in -x265-params
+            input_path = os.path.abspath(input_path)
+            output_path = os.path.abspath(output_path)
+        
+        # Base FFmpeg command (no banner, no stats and no stdin polling:
+        # only errors are written to the pipe)
+        cmd = [find_executable("ffmpeg"), "-hide_banner", "-nostdin", "-loglevel", "error"]
         
-        # Base FFmpeg command
-        cmd = ["ffmpeg", "-i", input_path]
+        if hwaccel != 'none':
+            cmd.extend(hwaccel_input_args(codec))
+        if threads:
+            # Limits the decoder; the encoder limit follows the codec options
+            cmd.extend(["-threads", str(threads)])
+        
+        cmd.extend(["-i", input_path])
         
         # Add scaling if max_width is specified
-        if max_width:
-            cmd.extend(["-vf", f"scale='min({max_width},iw)':-2"])
-        
-        # Add video codec settings
-        cmd.extend([
-            "-c:v", codec,
-            "-crf", str(crf),
-            "-preset", preset
-        ])
-        
-        # Add audio settings
-        cmd.extend([
-            "-c:a", "aac",
-            "-b:a", audio_bitrate
-        ])
-        
-        # Add additional optimization flags based on codec
-        if codec == 'libx265':
-            cmd.extend(["-x265-params", "log-level=error"])
-        
-        # Output file
-        cmd.extend(["-y", output_path])
-        
-        # Run FFmpeg
-        process = subprocess.run(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        cmd.extend(video_filter_args(codec, max_width))
+        
+        def video_args(pass_number=None):
+            """Get the video codec settings, optionally for one of two passes."""
+            if bitrate:
+                args = video_bitrate_args(codec, bitrate, preset, pass_number, threads=threads)
+                if not codec.endswith(('_nvenc', '_amf')):
+                    # Cap the peaks so the average doesn't hide bursts
+                    args.extend(["-maxrate", str(int(bitrate * 1.5)), "-bufsize", str(bitrate * 2)])
+                return args
+            args = video_codec_args(codec, crf, preset, threads)
+            if pass_number:
+                args.extend(["-pass", str(pass_number), "-passlogfile", "ffmpeg2pass"])
+            return args
+        
+        if two_pass:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                # The first pass only writes the statistics
+                first_pass = cmd + video_args(1) + ["-an", "-f", "null", os.devnull]
+                returncode, stderr = run_ffmpeg(first_pass, duration, on_progress, tmpdir, cpus)
+                if returncode != 0:
+                    return False, f"FFmpeg error: {stderr}", 0
+                
+                returncode, stderr = _run_output(cmd + video_args(2), output_path, audio_bitrate,
+                                                 duration, on_progress, tmpdir, cpus)
+        else:
+            returncode, stderr = _run_output(cmd + video_args(), output_path, audio_bitrate,
+                                             duration, on_progress, cpus=cpus)
         
-        if process.returncode != 0:
-            return False, f"FFmpeg error: {process.stderr}", 0
+        if returncode != 0:
+            return False, f"FFmpeg error: {stderr}", 0
         
         # Get compressed file info
         compressed_size_mb = os.path.getsize(output_path) / (1024 * 1024)
@@ -148,25 +451,279 @@ def compress_video(
         return False, f"Error: {str(e)}", 0
 
 
+def _run_output(
+    cmd: List[str],
+    output_path: str,
+    audio_bitrate: str,
+    duration: Optional[float],
+    on_progress: Optional[Callable[[Progress], None]],
+    cwd: Optional[str] = None,
+    cpus: Optional[List[int]] = None
+) -> Tuple[int, str]:
+    """Add the audio and muxer options to a command and run it."""
+    cmd = cmd + ["-c:a", "aac", "-b:a", audio_bitrate]
+    cmd.extend(container_args(output_path))
+    cmd.extend(["-y", output_path])
+    return run_ffmpeg(cmd, duration, on_progress, cwd, cpus)
+
+
+class OutputSpec(NamedTuple):
+    """One output of a multi-output encode."""
+    codec: str
+    crf: int
+    max_width: Optional[int]
+    path: str
+    max_height: Optional[int] = None
+
+
+def parse_output_spec(value: str) -> OutputSpec:
+    """
+    Parse a --output-spec value of the form codec:crf:width:path.
+    
+    The width may be left empty (or 0) to keep the source resolution.
+    """
+    # The path comes last so it may contain colons (e.g. C:\\videos)
+    parts = value.split(':', 3)
+    if len(parts) != 4 or not parts[3]:
+        raise argparse.ArgumentTypeError(f"expected codec:crf:width:path, got '{value}'")
+    codec, crf, width, path = parts
+    try:
+        return OutputSpec(codec, int(crf), int(width) if width else None, path)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"crf and width must be integers in '{value}'")
+
+
+def _output_filter(codec: str, max_width: Optional[int], max_height: Optional[int] = None) -> Optional[str]:
+    """Get the software scaling filter (plus VAAPI upload) for one output."""
+    filters = []
+    if max_height:
+        filters.append(f"scale=-2:'min({max_height},ih)'")
+    elif max_width:
+        filters.append(f"scale='min({max_width},iw)':-2")
+    if codec.endswith('_vaapi'):
+        filters.extend(["format=nv12", "hwupload"])
+    return ",".join(filters) or None
+
+
+def compress_video_outputs(
+    input_path: str,
+    outputs: List[OutputSpec],
+    preset: str = 'medium',
+    audio_bitrate: str = '128k',
+    hwaccel: str = 'none',
+    threads: Optional[int] = None,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+    skip_mkdir: bool = False,
+    cpus: Optional[List[int]] = None
+) -> Tuple[bool, str]:
+    """
+    Compress a video to several outputs with a single FFmpeg run.
+    
+    The source is decoded once; when the outputs are scaled differently
+    the decoded frames are split in a filter graph and scaled per output.
+    Decoding stays on the CPU because the outputs may use different
+    encoders. skip_mkdir means the caller already created the output
+    directories; cpus pins FFmpeg to those CPUs.
+    
+    Returns:
+        Tuple of (success, message)
+    """
+    start_time = time.time()
+    
+    try:
+        # FFmpeg is only probed when the ETA needs the duration
+        original_size_mb = os.path.getsize(input_path) / (1024 * 1024)
+        duration = get_video_info(input_path).get('duration') if on_progress else None
+        
+        codecs = [resolve_encoder(spec.codec, hwaccel) for spec in outputs]
+        filters = [_output_filter(codec, spec.max_width, spec.max_height) for codec, spec in zip(codecs, outputs)]
+        
+        cmd = [find_executable("ffmpeg"), "-hide_banner", "-nostdin", "-loglevel", "error"]
+        if any(codec.endswith('_vaapi') for codec in codecs):
+            cmd.extend(["-vaapi_device", VAAPI_DEVICE])
+        if threads:
+            cmd.extend(["-threads", str(threads)])
+        cmd.extend(["-i", input_path])
+        
+        # Identical filters can run per output; otherwise split the decoded
+        # frames once and give every output its own branch
+        split = len(outputs) > 1 and len(set(filters)) > 1
+        if split:
+            graph = [f"[0:v]split={len(outputs)}" + "".join(f"[s{i}]" for i in range(len(outputs)))]
+            for i, output_filter in enumerate(filters):
+                graph.append(f"[s{i}]{output_filter or 'null'}[v{i}]")
+            cmd.extend(["-filter_complex", ";".join(graph)])
+        
+        for i, (codec, spec) in enumerate(zip(codecs, outputs)):
+            if not skip_mkdir:
+                os.makedirs(os.path.dirname(spec.path) or ".", exist_ok=True)
+            
+            if split:
+                cmd.extend(["-map", f"[v{i}]", "-map", "0:a?"])
+            elif filters[i]:
+                cmd.extend(["-vf", filters[i]])
+            
+            cmd.extend(video_codec_args(codec, spec.crf, preset, threads))
+            cmd.extend(["-c:a", "aac", "-b:a", audio_bitrate])
+            cmd.extend(container_args(spec.path))
+            cmd.extend(["-y", spec.path])
+        
+        returncode, stderr = run_ffmpeg(cmd, duration, on_progress, cpus=cpus)
+        
+        if returncode != 0:
+            return False, f"FFmpeg error: {stderr}"
+        
+        lines = ["Compression complete:", f"Original size: {original_size_mb:.2f} MB"]
+        for codec, spec in zip(codecs, outputs):
+            compressed_size_mb = os.path.getsize(spec.path) / (1024 * 1024)
+            compression_ratio = original_size_mb / compressed_size_mb if compressed_size_mb > 0 else 0
+            lines.append(
+                f"{spec.path} ({codec}): {compressed_size_mb:.2f} MB, "
+                f"ratio {compression_ratio:.2f}x"
+            )
+        lines.append(f"Time taken: {time.time() - start_time:.2f} seconds")
+        
+        return True, "\n".join(lines)
+        
+    except Exception as e:
+        return False, f"Error: {str(e)}"
+
+
+def parse_tiers(value: str) -> List[int]:
+    """Parse a --tiers value such as '1080,720,480' into heights."""
+    try:
+        tiers = sorted({int(tier) for tier in value.split(',') if tier.strip()}, reverse=True)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated heights, got '{value}'")
+    if not tiers or min(tiers) <= 0:
+        raise argparse.ArgumentTypeError(f"expected comma-separated heights, got '{value}'")
+    return tiers
+
+
+def compress_video_tiers(
+    input_path: str,
+    output_dir: str,
+    tiers: List[int],
+    codec: str = 'libx265',
+    crf: int = 28,
+    preset: str = 'medium',
+    audio_bitrate: str = '128k',
+    hwaccel: str = 'none',
+    threads: Optional[int] = None,
+    skip_mkdir: bool = False,
+    cpus: Optional[List[int]] = None
+) -> Tuple[bool, str]:
+    """
+    Compress a video to several heights (e.g. 1080, 720 and 480 lines).
+    
+    All tiers come from one decode of the source, named like
+    compressed_clip_720p.mp4; sources smaller than a tier keep their size.
+    """
+    stem, ext = os.path.splitext(os.path.basename(input_path))
+    outputs = [
+        OutputSpec(codec, crf, None, os.path.join(output_dir, f"compressed_{stem}_{tier}p{ext}"), tier)
+        for tier in tiers
+    ]
+    return compress_video_outputs(input_path, outputs, preset, audio_bitrate, hwaccel, threads,
+                                  skip_mkdir=skip_mkdir, cpus=cpus)
+
+
 def batch_process(
     input_files: List[str],
     output_dir: str,
-    target_size_mb: int = 30,
+    target_size_mb: Optional[float] = None,
     codec: str = 'libx265',
     crf: int = 28,
     preset: str = 'medium',
     audio_bitrate: str = '128k',
     max_width: Optional[int] = None,
-    max_workers: int = 1
+    max_workers: int = 1,
+    hwaccel: str = 'none',
+    threads: Optional[int] = None,
+    large_workers: Optional[int] = None,
+    tiers: Optional[List[int]] = None,
+    fail_fast: bool = False,
+    two_pass: bool = False,
+    force_reencode: bool = False,
+    cpu_affinity: bool = False
 ) -> None:
-    """Process multiple video files in batch."""
+    """
+    Process multiple video files in batch.
+    
+    If tiers is given, every file is compressed to each of those heights
+    instead of a single output. With fail_fast, no new files are started
+    once one fails. Files that are already HEVC or VP9 and under the target
+    size are linked (or copied) to the output unless force_reencode is set.
+    
+    With several workers each FFmpeg run gets an even share of the cores
+    unless threads is given, so parallel jobs don't oversubscribe the CPU.
+    If large_workers is set, videos above LARGE_VIDEO_PIXELS run in their
+    own pool of that size so several 4K encodes can't exhaust the RAM.
+    With cpu_affinity, every running job is pinned to its own set of CPUs.
+    """
     os.makedirs(output_dir, exist_ok=True)
     
+    total_workers = max_workers + (large_workers or 0)
+    if threads is None and total_workers > 1:
+        threads = _threads_per_job(total_workers)
+    
+    # Do the one-time setup before the workers start instead of racing to
+    # do it in each of them: find FFmpeg, load the cached probe and pick
+    # the encoder (--hwaccel auto runs test encodes)
+    find_executable("ffmpeg")
+    probe_ffmpeg()
+    resolve_encoder(codec, hwaccel)
+    
+    # One disjoint CPU set per worker; a job borrows a free set while it runs
+    cpu_sets = None
+    if cpu_affinity and total_workers > 1:
+        cpu_count = os.cpu_count() or 1
+        cpu_sets = queue.Queue()
+        for i in range(total_workers):
+            cpu_sets.put(list(range(i, cpu_count, total_workers)) or None)
+    
     def process_file(input_path):
+        cpus = cpu_sets.get() if cpu_sets else None
+        try:
+            return encode_file(input_path, cpus)
+        finally:
+            if cpu_sets:
+                cpu_sets.put(cpus)
+    
+    def encode_file(input_path, cpus):
         filename = os.path.basename(input_path)
         output_path = os.path.join(output_dir, f"compressed_{filename}")
         
-        print(f"Processing: {input_path}")
+        log.info(f"Processing: {input_path}", extra={'event': 'start', 'file': input_path})
+        if target_size_mb and not tiers and not force_reencode:
+            try:
+                info = get_video_info(input_path)
+                if info.get('codec') in COMPRESSED_CODECS and info['size_mb'] <= target_size_mb:
+                    _link_or_copy(input_path, output_path)
+                    log.info(f"Skipped (already compressed): {input_path} -> {output_path}",
+                             extra={'event': 'skipped', 'file': input_path})
+                    return True
+            except OSError as e:
+                log.error(f"Error: {e}", extra={'event': 'failed', 'file': input_path})
+                return False
+        
+        if tiers:
+            success, message = compress_video_tiers(
+                input_path,
+                output_dir,
+                tiers,
+                codec,
+                crf,
+                preset,
+                audio_bitrate,
+                hwaccel,
+                threads,
+                skip_mkdir=True,
+                cpus=cpus
+            )
+            _log_result(success, message, input_path)
+            return success
+        
         success, message, _ = compress_video(
             input_path, 
             output_path,
@@ -175,33 +732,454 @@ def batch_process(
             crf,
             preset,
             audio_bitrate,
-            max_width
+            max_width,
+            hwaccel,
+            threads,
+            skip_mkdir=True,
+            two_pass=two_pass,
+            cpus=cpus
         )
         
-        print(message)
+        _log_result(success, message, input_path)
         return success
     
-    # Use ThreadPoolExecutor for parallel processing if max_workers > 1
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        results = list(executor.map(process_file, input_files))
+    regular_files, large_files = input_files, []
+    if large_workers:
+        regular_files = []
+        for path in input_files:
+            (large_files if _is_large_video(path) else regular_files).append(path)
+    
+    success_count = 0
+    stopped = False
+    
+    # Files are only handed to a pool when one of its workers is free, so
+    # the number of jobs in flight stays bounded and a failure can stop
+    # the batch before more files are started
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            ThreadPoolExecutor(max_workers=large_workers or 1) as large_executor:
+        pools = [
+            (executor, deque(regular_files), max_workers),
+            (large_executor, deque(large_files), large_workers or 1),
+        ]
+        in_flight = [0] * len(pools)
+        running = {}
+        
+        def fill():
+            for i, (pool, pending, limit) in enumerate(pools):
+                while pending and in_flight[i] < limit:
+                    running[pool.submit(process_file, pending.popleft())] = i
+                    in_flight[i] += 1
+        
+        fill()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight[running.pop(future)] -= 1
+                if future.result():
+                    success_count += 1
+                elif fail_fast and not stopped:
+                    stopped = True
+                    log.warning("Stopping after the first failure; waiting for running jobs to finish.")
+            if not stopped:
+                fill()
+    
+    log.info(f"Batch processing complete. {success_count}/{len(input_files)} files processed successfully.",
+             extra={'event': 'batch_done', 'succeeded': success_count, 'total': len(input_files)})
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Hard-link a file to a new path, copying it where links aren't possible."""
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Different filesystem, or one without hard links
+        shutil.copy2(src, dst)
+
+
+def iter_videos(root: str):
+    """Yield the paths of all video files below a directory."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in VIDEO_EXTS and entry.is_file():
+                        yield entry.path
+        except OSError:
+            # Skip directories we can't read, like os.walk does
+            continue
+
+
+def _is_large_video(video_path: str) -> bool:
+    """Check if a video has more pixels than LARGE_VIDEO_PIXELS."""
+    try:
+        width, height = get_video_info(video_path).get('resolution', '0x0').split('x')
+        return int(width) * int(height) > LARGE_VIDEO_PIXELS
+    except (OSError, ValueError):
+        return False
+
+
+class FFmpegProbe(NamedTuple):
+    """Version line and encoder names of the FFmpeg binary in PATH."""
+    version: str
+    encoders: FrozenSet[str]
+
+
+def probe_ffmpeg() -> Optional[FFmpegProbe]:
+    """
+    Get the version and encoders of the FFmpeg binary in PATH.
+    
+    The result is cached on disk by binary path, modification time and
+    size, so FFmpeg is only run again after it is replaced or upgraded.
+    Returns None if FFmpeg is missing or doesn't run.
+    """
+    path = shutil.which("ffmpeg")
+    if path is None:
+        return None
+    stat = os.stat(path)
+    return _probe_cached(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=None)
+def _probe_cached(path: str, mtime_ns: int, size: int) -> Optional[FFmpegProbe]:
+    """Load the probe for an FFmpeg binary from the disk cache or run it."""
+    key = [path, mtime_ns, size]
+    try:
+        with open(PROBE_CACHE_PATH, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["key"] == key:
+            return FFmpegProbe(cached["version"], frozenset(cached["encoders"]))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    try:
+        version_result = subprocess.run(
+            [path, "-version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if version_result.returncode != 0:
+            return None
+        encoders_result = subprocess.run(
+            [path, "-hide_banner", "-encoders"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+    except (subprocess.SubprocessError, OSError):
+        return None
     
-    success_count = sum(1 for r in results if r)
-    print(f"\nBatch processing complete. {success_count}/{len(input_files)} files processed successfully.")
+    encoders = set()
+    for line in encoders_result.stdout.split('\n'):
+        # Encoder lines look like " V....D libx264    libx264 H.264 / AVC ..."
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0] != '------':
+            encoders.add(parts[1])
+    
+    probe = FFmpegProbe(version_result.stdout.split('\n')[0], frozenset(encoders))
+    
+    # Write to a temporary file first so parallel runs never read half a file
+    try:
+        os.makedirs(os.path.dirname(PROBE_CACHE_PATH), exist_ok=True)
+        tmp_path = f"{PROBE_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "version": probe.version, "encoders": sorted(encoders)}, f)
+        os.replace(tmp_path, PROBE_CACHE_PATH)
+    except OSError:
+        pass
+    
+    return probe
 
 
 def check_ffmpeg():
     """Check if FFmpeg is installed."""
+    return probe_ffmpeg() is not None
+
+
+def get_available_encoders() -> Set[str]:
+    """Get the names of all encoders FFmpeg was built with."""
+    probe = probe_ffmpeg()
+    return set(probe.encoders) if probe else set()
+
+
+def hwaccel_input_args(codec: str) -> List[str]:
+    """
+    Get the hardware decoding options that precede the input for a codec.
+    
+    NVENC and VAAPI keep decoded frames in GPU memory so they never cross
+    the bus before encoding; software encoders still let FFmpeg decode on
+    whatever hardware is available.
+    """
+    if codec.endswith('_vaapi'):
+        return ["-vaapi_device", VAAPI_DEVICE, "-hwaccel", "vaapi", "-hwaccel_output_format", "vaapi"]
+    if codec.endswith('_nvenc'):
+        return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"]
+    if codec.endswith('_videotoolbox'):
+        return ["-hwaccel", "videotoolbox"]
+    return ["-hwaccel", "auto"]
+
+
+def video_filter_args(codec: str, max_width: Optional[int] = None) -> List[str]:
+    """Get the video filter options for scaling with the given encoder."""
+    if codec.endswith('_vaapi'):
+        # Frames have to live in VAAPI surfaces before scale_vaapi and the encoder
+        filters = ["format=nv12|vaapi", "hwupload"]
+        if max_width:
+            filters.append(f"scale_vaapi=w='min({max_width},iw)':h=-2")
+        return ["-vf", ",".join(filters)]
+    
+    if codec.endswith('_nvenc'):
+        # Frames are already CUDA surfaces, so scale them on the GPU
+        if max_width:
+            return ["-vf", f"scale_cuda=w='min({max_width},iw)':h=-2"]
+        return []
+    
+    if max_width:
+        return ["-vf", f"scale='min({max_width},iw)':-2"]
+    return []
+
+
+def video_codec_args(codec: str, crf: int, preset: str, threads: Optional[int] = None) -> List[str]:
+    """
+    Get the FFmpeg video encoder options for a codec.
+    
+    Hardware encoders have no CRF, so the CRF value is passed to their
+    closest constant-quality mode instead. threads limits the software
+    encoders' thread pools.
+    """
+    if codec.endswith('_nvenc'):
+        return ["-c:v", codec, "-rc", "vbr", "-cq", str(crf), "-b:v", "0",
+                "-preset", "p5", "-tune", "hq"]
+    if codec.endswith('_qsv'):
+        qsv_preset = preset if preset in QSV_PRESETS else "veryfast"
+        return ["-c:v", codec, "-global_quality", str(crf), "-preset", qsv_preset]
+    if codec.endswith('_vaapi'):
+        return ["-c:v", codec, "-qp", str(crf)]
+    if codec.endswith('_videotoolbox'):
+        # -q:v runs from 1 to 100 and higher is better, unlike CRF
+        quality = max(1, min(100, 100 - 2 * crf))
+        return ["-c:v", codec, "-q:v", str(quality)]
+    if codec.endswith('_amf'):
+        return ["-c:v", codec, "-rc", "cqp", "-qp_i", str(crf), "-qp_p", str(crf)]
+    
+    if codec in ('vp9', 'libvpx-vp9'):
+        # libvpx only runs in constant-quality mode with -b:v 0
+        args = ["-c:v", codec, "-crf", str(crf), "-b:v", "0"] + vp9_speed_args(preset)
+        if threads:
+            args.extend(["-threads", str(threads)])
+        return args
+    
+    args = ["-c:v", codec, "-crf", str(crf), "-preset", preset]
+    if codec == 'libx265':
+        # x265 sizes its thread pools itself and ignores -threads
+        x265_params = "log-level=error"
+        if threads:
+            x265_params = f"pools={threads}:{x265_params}"
+        args.extend(["-x265-params", x265_params])
+    elif threads:
+        args.extend(["-threads", str(threads)])
+    return args
+
+
+def vp9_speed_args(preset: str) -> List[str]:
+    """
+    Get the libvpx-vp9 speed options matching an x264-style preset.
+    
+    libvpx has no -preset; row-based multithreading and tile columns let
+    it use more than a couple of cores.
+    """
+    return ["-deadline", "good", "-cpu-used", str(VP9_CPU_USED.get(preset, 2)),
+            "-row-mt", "1", "-tile-columns", "2"]
+
+
+def container_args(output_path: str) -> List[str]:
+    """Get the muxer options for an output file based on its extension."""
+    if Path(output_path).suffix.lower() in FASTSTART_EXTENSIONS:
+        # Put the index before the media data so players can start right away
+        return ["-movflags", "+faststart"]
+    return []
+
+
+def _threads_per_job(max_workers: int) -> int:
+    """Split the CPU cores evenly between parallel FFmpeg jobs."""
+    return max(1, (os.cpu_count() or max_workers) // max_workers)
+
+
+def is_hardware_encoder(codec: str) -> bool:
+    """Check if a codec name refers to a hardware encoder."""
+    return codec.endswith(HW_ENCODER_SUFFIXES)
+
+
+def parse_bitrate(bitrate: str) -> int:
+    """Convert an FFmpeg bitrate string such as '128k' or '2M' to bits per second."""
+    multipliers = {'k': 1000, 'm': 1000 ** 2}
+    suffix = bitrate[-1:].lower()
+    if suffix in multipliers:
+        return int(float(bitrate[:-1]) * multipliers[suffix])
+    return int(bitrate)
+
+
+def target_video_bitrate(target_size_mb: float, duration: float, audio_bitrate: str) -> int:
+    """Compute the video bitrate that makes the output land on a target size."""
+    target_bits = target_size_mb * 1024 * 1024 * 8
+    audio_bits = parse_bitrate(audio_bitrate) * duration
+    return max(MIN_VIDEO_BITRATE, int((target_bits - audio_bits) / duration))
+
+
+def video_bitrate_args(
+    codec: str,
+    bitrate: int,
+    preset: str,
+    pass_number: Optional[int] = None,
+    passlog: str = "ffmpeg2pass",
+    threads: Optional[int] = None
+) -> List[str]:
+    """
+    Get the FFmpeg video encoder options for encoding at a target bitrate.
+    
+    For two-pass encodes, pass_number is 1 or 2 and passlog is the prefix of
+    the pass log files. libx265 takes the pass settings through -x265-params.
+    Hardware encoders are always single pass. threads limits the software
+    encoders' thread pools.
+    """
+    if codec.endswith('_nvenc'):
+        return ["-c:v", codec, "-rc", "vbr", "-b:v", str(bitrate),
+                "-maxrate", str(int(bitrate * 1.5)), "-bufsize", str(bitrate * 2),
+                "-preset", "p5", "-tune", "hq"]
+    if codec.endswith('_qsv'):
+        qsv_preset = preset if preset in QSV_PRESETS else "veryfast"
+        return ["-c:v", codec, "-b:v", str(bitrate), "-preset", qsv_preset]
+    if codec.endswith(('_vaapi', '_videotoolbox')):
+        return ["-c:v", codec, "-b:v", str(bitrate)]
+    if codec.endswith('_amf'):
+        return ["-c:v", codec, "-rc", "vbr_peak", "-b:v", str(bitrate),
+                "-maxrate", str(int(bitrate * 1.5))]
+    
+    if codec in ('vp9', 'libvpx-vp9'):
+        args = ["-c:v", codec, "-b:v", str(bitrate)] + vp9_speed_args(preset)
+    else:
+        args = ["-c:v", codec, "-b:v", str(bitrate), "-preset", preset]
+    if codec == 'libx265':
+        x265_params = "log-level=error"
+        if threads:
+            x265_params = f"pools={threads}:{x265_params}"
+        if pass_number:
+            x265_params = f"pass={pass_number}:stats={passlog}.log:{x265_params}"
+        args.extend(["-x265-params", x265_params])
+    else:
+        if threads:
+            args.extend(["-threads", str(threads)])
+        if pass_number:
+            args.extend(["-pass", str(pass_number), "-passlogfile", passlog])
+    return args
+
+
+def check_encoder(codec: str) -> bool:
+    """Check that an encoder actually works by encoding a few blank frames."""
+    cmd = [find_executable("ffmpeg"), "-hide_banner", "-loglevel", "error"]
+    cmd.extend(hwaccel_input_args(codec))
+    cmd.extend(["-f", "lavfi", "-i", "color=black:s=256x256:d=0.2"])
+    cmd.extend(video_filter_args(codec))
+    cmd.extend(video_codec_args(codec, 28, "medium"))
+    cmd.extend(["-f", "null", "-"])
+    
     try:
-        subprocess.run(
-            ["ffmpeg", "-version"], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE
-        )
-        return True
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return result.returncode == 0
     except (subprocess.SubprocessError, FileNotFoundError):
         return False
 
 
+# Hardware encoders FFmpeg was built with, None until detect_hwaccel() runs
+_hw_encoders = None
+
+
+def detect_hwaccel() -> Set[str]:
+    """
+    Get the hardware encoder families FFmpeg was built with.
+    
+    The encoder list is only read once per process; being built in does not
+    mean the hardware is present, see resolve_encoder().
+    """
+    global _hw_encoders
+    if _hw_encoders is None:
+        _hw_encoders = {name for name in get_available_encoders() if is_hardware_encoder(name)}
+    return {
+        family for family in HWACCEL_FAMILIES
+        if any(name.endswith(f"_{family}") for name in _hw_encoders)
+    }
+
+
+@lru_cache(maxsize=None)
+def resolve_encoder(codec: str, hwaccel: str = 'none') -> str:
+    """
+    Get the encoder to use for a software codec and a --hwaccel choice.
+    
+    'auto' picks the first family in HWACCEL_FAMILIES whose encoder passes a
+    test encode; a named family is used if FFmpeg has that encoder. The
+    software codec is returned when no hardware encoder fits.
+    """
+    prefix = HW_CODEC_PREFIXES.get(codec)
+    if hwaccel == 'none' or prefix is None:
+        return codec
+    
+    families = detect_hwaccel()
+    if hwaccel == 'auto':
+        for family in HWACCEL_FAMILIES:
+            hw_codec = f"{prefix}_{family}"
+            if family in families and hw_codec in _hw_encoders and check_encoder(hw_codec):
+                return hw_codec
+        return codec
+    
+    hw_codec = f"{prefix}_{hwaccel}"
+    if hw_codec in _hw_encoders:
+        return hw_codec
+    
+    log.warning(f"Warning: FFmpeg has no {hw_codec} encoder, using {codec}.")
+    return codec
+
+
+class _JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line for other tools."""
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        return json.dumps(entry)
+
+
+def setup_logging(log_format: str = 'text') -> None:
+    """Send the log to stdout through a single handler, as text or JSON lines."""
+    handler = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        handler.setFormatter(_JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+
+
+def _log_result(success: bool, message: str, input_path: str) -> None:
+    """Log how encoding an input went, as a "done" or an error-level "failed" event."""
+    if success:
+        log.info(message, extra={'event': 'done', 'file': input_path})
+    else:
+        log.error(message, extra={'event': 'failed', 'file': input_path})
+
+
 def main():
     parser = argparse.ArgumentParser(description="Compress video files while maintaining quality")
     
@@ -210,7 +1188,8 @@ def main():
     parser.add_argument("-o", "--output", default="compressed", help="Output directory or file (if single input)")
     
     # Compression options
-    parser.add_argument("-s", "--size", type=int, default=30, help="Target size in MB (default: 30)")
+    parser.add_argument("-s", "--size", type=float,
+                        help="Target size in MB; encodes at the matching bitrate instead of the CRF (default: CRF decides the size)")
     parser.add_argument("-c", "--codec", choices=["libx264", "libx265", "vp9"], default="libx265", 
                         help="Video codec (default: libx265/HEVC)")
     parser.add_argument("--crf", type=int, default=28, help="Constant Rate Factor - quality (lower is better, default: 28)")
@@ -219,15 +1198,41 @@ def main():
                         default="medium", help="Encoding preset (default: medium)")
     parser.add_argument("-a", "--audio", default="128k", help="Audio bitrate (default: 128k)")
     parser.add_argument("-w", "--max-width", type=int, help="Maximum width to scale video to (keeps aspect ratio)")
+    parser.add_argument("--two-pass", action="store_true",
+                        help="Encode in two passes (with --size for any software codec, otherwise vp9 only)")
+    parser.add_argument("--hwaccel", choices=["none", "auto"] + list(HWACCEL_FAMILIES), default="none",
+                        help="Encode on the GPU with a hardware encoder, 'auto' picks the first one that works (default: none)")
+    
+    parser.add_argument("--output-spec", action="append", type=parse_output_spec, metavar="CODEC:CRF:WIDTH:PATH",
+                        help="Write an extra output from the same decode, e.g. libx264:30:640:preview.mp4 "
+                             "(repeatable, single input only; WIDTH may be empty)")
+    parser.add_argument("--tiers", type=parse_tiers, metavar="HEIGHTS",
+                        help="Compress every input to each of these heights from one decode, e.g. 1080,720,480 "
+                             "(the output is used as a directory)")
     
     # Batch processing options
     parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of parallel jobs (default: 1)")
+    parser.add_argument("--jobs-4k", type=int,
+                        help="Encode videos over half the pixels of 4K in a separate queue with this many parallel jobs "
+                             "(default: same queue as the other videos)")
+    parser.add_argument("--force-reencode", action="store_true",
+                        help="Re-encode HEVC/VP9 files that are already under the target size instead of copying them (batch mode)")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="Stop starting new files once one fails (batch mode)")
+    parser.add_argument("--log-format", choices=["text", "json"], default="text",
+                        help="Print the log as text or as one JSON object per line (default: text)")
+    parser.add_argument("--cpu-affinity", action="store_true",
+                        help="Pin each parallel job to its own set of CPUs (batch mode; Linux, or Windows with psutil)")
+    parser.add_argument("--ffmpeg-threads", type=int,
+                        help="Threads per FFmpeg job (default: all cores, split evenly between parallel jobs)")
     
     args = parser.parse_args()
     
+    setup_logging(args.log_format)
+    
     # Check if FFmpeg is installed
     if not check_ffmpeg():
-        print("Error: FFmpeg is not installed or not in PATH. Please install FFmpeg first.")
+        log.error("Error: FFmpeg is not installed or not in PATH. Please install FFmpeg first.")
         sys.exit(1)
     
     # Collect input files
@@ -235,21 +1240,53 @@ def main():
     for input_path in args.input:
         if os.path.isdir(input_path):
             # If input is a directory, find all video files
-            for root, _, files in os.walk(input_path):
-                for file in files:
-                    if file.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv')):
-                        input_files.append(os.path.join(root, file))
+            input_files.extend(iter_videos(input_path))
         elif os.path.isfile(input_path):
             input_files.append(input_path)
         else:
-            print(f"Warning: Input '{input_path}' does not exist, skipping.")
+            log.warning(f"Warning: Input '{input_path}' does not exist, skipping.")
     
     if not input_files:
-        print("Error: No valid input files found.")
+        log.error("Error: No valid input files found.")
         sys.exit(1)
     
+    if args.two_pass and args.size is None and args.codec != 'vp9':
+        log.warning("Warning: without --size, --two-pass only applies to vp9, encoding in a single pass.")
+    
+    if args.output_spec and args.tiers:
+        log.error("Error: --output-spec and --tiers can't be used together.")
+        sys.exit(1)
+    
+    if args.output_spec and len(input_files) != 1:
+        log.error("Error: --output-spec can only be used with a single input file.")
+        sys.exit(1)
+    
+    if args.hwaccel != 'none':
+        encoder = resolve_encoder(args.codec, args.hwaccel)
+        if encoder != args.codec:
+            log.info(f"Using hardware encoder: {encoder}")
+        elif args.hwaccel == 'auto':
+            log.info(f"No working hardware encoder found, using {args.codec}.")
+    
+    # Main output plus the --output-spec ones from one decode
+    if args.output_spec:
+        output_path = args.output
+        if os.path.isdir(output_path):
+            output_path = os.path.join(output_path, f"compressed_{os.path.basename(input_files[0])}")
+        
+        outputs = [OutputSpec(args.codec, args.crf, args.max_width, output_path)] + args.output_spec
+        success, message = compress_video_outputs(
+            input_files[0],
+            outputs,
+            args.preset,
+            args.audio,
+            args.hwaccel,
+            args.ffmpeg_threads
+        )
+        _log_result(success, message, input_files[0])
+    
     # Single file mode
-    if len(input_files) == 1 and not os.path.isdir(args.output):
+    elif len(input_files) == 1 and not os.path.isdir(args.output) and not args.tiers:
         output_path = args.output
         if os.path.isdir(output_path):
             output_path = os.path.join(output_path, f"compressed_{os.path.basename(input_files[0])}")
@@ -262,9 +1299,12 @@ def main():
             args.crf,
             args.preset,
             args.audio,
-            args.max_width
+            args.max_width,
+            args.hwaccel,
+            args.ffmpeg_threads,
+            two_pass=args.two_pass
         )
-        print(message)
+        _log_result(success, message, input_files[0])
     
     # Batch mode
     else:
@@ -277,7 +1317,15 @@ def main():
             args.preset,
             args.audio,
             args.max_width,
-            args.jobs
+            args.jobs,
+            args.hwaccel,
+            args.ffmpeg_threads,
+            args.jobs_4k,
+            args.tiers,
+            args.fail_fast,
+            args.two_pass,
+            args.force_reencode,
+            args.cpu_affinity
         )
 
 
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for the Video Compressor API Server.
+
+Run with gunicorn, keeping a single worker process: the job queue and the
+running FFmpeg processes (needed for cancelling) live in that process, and
+each worker marks the jobs still running in jobs.db as failed on import:
+
+    gunicorn -k gthread -w 1 --threads 16 --timeout 0 -b 0.0.0.0:5000 wsgi:app
+"""
+
+import logging
+
+from api_server import app, check_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+if not check_ffmpeg():
+    logger.error("FFmpeg is not installed or not in PATH. Please install FFmpeg first.")